@@ -14,16 +14,18 @@ Key Features:
 
 """
 
-# Core modules
-from . import config
-from . import logging_config
+import importlib
 
-# Processing modules
-from . import s3_utils
-from . import pdf_anonymizer
-
-# Main entry point
-from .main import lambda_handler
+# Submodules and the handler are resolved lazily (PEP 562) so importing one
+# module, e.g. ``bp_ecg_etl.config``, does not pull in PyMuPDF and aioboto3
+_LAZY_SUBMODULES = {
+    # Core
+    "config",
+    "logging_config",
+    # Processing
+    "s3_utils",
+    "pdf_anonymizer",
+}
 
 __version__ = "2.0.0-simplified"
 __author__ = "BP-ECG ETL Team"
@@ -38,3 +40,18 @@ __all__ = [
     # Main
     "lambda_handler",
 ]
+
+
+def __getattr__(name):
+    """Import submodules and the Lambda handler on first attribute access."""
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name == "lambda_handler":
+        from .main import lambda_handler
+        return lambda_handler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    """Include lazily resolved attributes in ``dir()``."""
+    return sorted(set(globals()) | set(__all__))
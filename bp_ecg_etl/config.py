@@ -6,11 +6,39 @@ import os
 INPUT_BUCKET = os.getenv("INPUT_BUCKET", "test-input-bucket")
 OUTPUT_BUCKET = os.getenv("OUTPUT_BUCKET", "test-output-bucket")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "4"))  # including the first attempt
+# Objects larger than this are downloaded as concurrent byte-range GETs of this size
+S3_RANGE_CHUNK_SIZE = int(os.getenv("S3_RANGE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+# Outputs larger than this are uploaded as concurrent multipart parts of this size
+# (S3 requires at least 5 MiB per part, except the last one)
+S3_MULTIPART_PART_SIZE = int(os.getenv("S3_MULTIPART_PART_SIZE", str(16 * 1024 * 1024)))
+S3_MULTIPART_CONCURRENCY = int(os.getenv("S3_MULTIPART_CONCURRENCY", "8"))
 
 # Processing Configuration
-DPI_PAGE2_RENDER = int(os.getenv("DPI_PAGE2_RENDER", "220"))
+# Page 2 raster resolution; cost grows with DPI squared, and 150 DPI is enough
+# for a redacted ECG trace. Grayscale rendering cuts the raster to 1/3 the size.
+DPI_PAGE2_RENDER = int(os.getenv("DPI_PAGE2_RENDER", "150"))
+PAGE2_GRAYSCALE = os.getenv("PAGE2_GRAYSCALE", "false").lower() in ("1", "true", "yes")
 IMAGE_REDACT_MODE = int(os.getenv("IMAGE_REDACT_MODE", "2"))  # 1 = PDF_REDACT_IMAGE_NONE
 
+# Concurrency Configuration
+# Minimum Lambda memory (MB) before CPU work is fanned out to child processes;
+# smaller configurations get a single vCPU, where they only add overhead
+PROCESS_POOL_MIN_MEMORY_MB = int(os.getenv("PROCESS_POOL_MIN_MEMORY_MB", "3008"))
+
+# Download -> anonymize -> upload pipeline sizing. S3 throughput keeps scaling
+# up to ~4 transfers per vCPU, so the default follows the vCPU count between
+# the S3_CONCURRENCY floor and a ceiling of 200
+CPU_COUNT = os.cpu_count() or 1
+S3_CONCURRENCY = max(int(os.getenv("S3_CONCURRENCY", "8")), min(200, CPU_COUNT * 4))
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", str(S3_CONCURRENCY)))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", str(S3_CONCURRENCY)))
+# Enough pooled connections for every transfer worker, so aiohttp never queues
+S3_MAX_POOL_CONNECTIONS = int(
+    os.getenv("S3_MAX_POOL_CONNECTIONS", str(max(50, DOWNLOAD_WORKERS + UPLOAD_WORKERS)))
+)
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))  # backpressure bounds RAM
+
 # Anonymization Rules
 LINE_TOLERANCE = float(os.getenv("LINE_TOLERANCE", "1.0"))
 PREVLINE_TOLERANCE = float(os.getenv("PREVLINE_TOLERANCE", "10.0"))
@@ -36,23 +64,37 @@ KEEP_LABELS = [
     "Intervalo QT/QTc:", "Eixo P-QRS-T:", "Interpretação:"
 ]
 
-CRM_TOKENS = ["CRM", "CRM:", "crm"]
+# Label lookup compiled once at import: token -> "redact" | "keep".
+# Each label is stored with and without its trailing colon, so raw word tokens
+# are looked up as-is. KEEP_LABELS win, so a label listed in both is never redacted.
+LABEL_KINDS = {}
+for _kind, _labels in (("redact", LABELS_SAME_LINE), ("keep", KEEP_LABELS)):
+    for _label in _labels:
+        LABEL_KINDS[_label] = _kind
+        LABEL_KINDS[_label.removesuffix(":")] = _kind
+del _kind, _labels, _label
+
+# Frozen: only used for membership tests in the page-1 word loop
+CRM_TOKENS = frozenset({"CRM", "CRM:", "crm"})
 
-# Coordinate-based redaction areas (relative coordinates 0-1)
-PAGE1_REDACT_COORDS = [
+# Coordinate-based redaction areas (relative coordinates 0-1, clamped)
+# Tuples so the resolved rectangles can be cached per page size
+PAGE1_REDACT_COORDS = (
     (0.35, 0.90, 0.65, 0.95),  # Footer signature/CRM area
     (50, 50, 200, 80),   # Example coordinates - adjust as needed
     (300, 100, 500, 130)
-]
+)
 
-PAGE2_REDACT_COORDS = [
+PAGE2_REDACT_COORDS = (
     (0.02, 0.10, 0.12, 0.17),   # Top left (Name/RG...)
     (0.13, 0.10, 0.18, 0.135),  # Top left (CPF...)
     (0.40, 0.94, 0.98, 0.97),   # Footer (signature/CRM bar)
     (0.88, 0.85, 0.96, 0.92),   # Footer (right block)
     (100, 200, 400, 250),  # Example coordinates - adjust as needed
     (50, 300, 300, 350)
-]
+)
 
 # Image processing
 IMAGE_REDACT_MODE = "RGB"
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpg")  # Page 2 raster encoding: "jpg" or "png"
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "85"))
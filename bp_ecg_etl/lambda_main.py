@@ -1,61 +1,307 @@
 """Simple Lambda handler for PDF anonymization."""
 
 import asyncio
-import json
+import io
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import threading
 import time
 import urllib.parse
+import orjson
 import structlog
 
-from .s3_utils import download_pdf, upload_pdf, generate_output_key
+try:
+    import uvloop
+except ImportError:  # Optional: not built for every platform (e.g. Windows)
+    uvloop = None  # type: ignore[assignment]
+
+from .s3_utils import (
+    download_pdf,
+    upload_pdf,
+    generate_output_key,
+    content_size,
+    get_s3,
+    close_s3,
+)
 from .pdf_anonymizer import anonymize_pdf
-from .config import OUTPUT_BUCKET
+from .config import (
+    OUTPUT_BUCKET,
+    PROCESS_POOL_MIN_MEMORY_MB,
+    CPU_COUNT,
+    DOWNLOAD_WORKERS,
+    UPLOAD_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+)
 
 logger = structlog.get_logger(__name__)
 
+# Event loop kept in module scope so warm invocations reuse it, and with it
+# the cached S3 client that is bound to it
+_LOOP = None
+_OWNER_PID = os.getpid()
+
+# SIGTERM handler state: the handler that was installed before ours, if any
+_PREVIOUS_SIGTERM = None
+_SIGTERM_INSTALLED = False
+
+# Anonymizer child processes shared across warm invocations
+# (None = not created yet, False = unavailable)
+_PROCESSES = None
+
+# Serializes the in-thread fallback: a thread abandoned by a cancelled task may
+# still be running PyMuPDF when the next warm invocation starts
+_THREAD_ANONYMIZE_LOCK = threading.Lock()
+
+
+def _serve_anonymizer(conn):
+    """Child process loop: anonymize each PDF received on ``conn`` and send it back."""
+    while True:
+        try:
+            pdf_content = conn.recv_bytes()
+        except EOFError:
+            return  # The parent closed its end (or exited)
+
+        try:
+            output = anonymize_pdf(pdf_content)
+        except Exception as e:
+            # Same text the in-thread path reports (error_result uses str(e))
+            conn.send(str(e))
+        else:
+            conn.send(None)
+            conn.send_bytes(output.getbuffer())
+
+
+class AnonymizerProcess:
+    """Persistent child process running anonymize_pdf, fed through a Pipe.
+
+    Unlike ProcessPoolExecutor, whose semaphores need /dev/shm, a Process
+    talking over a Pipe works on AWS Lambda.
+    """
+
+    def __init__(self):
+        # Serializes request/reply pairs: a thread abandoned by a cancelled task
+        # still finishes its exchange before the next one starts
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        """Start (or restart) the child process."""
+        # Children are forked from a single-threaded forkserver rather than from
+        # this process, so a restart from a worker thread neither copies held
+        # locks nor the open S3 connections into the child
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve_anonymizer, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def anonymize(self, pdf_content: bytes) -> io.BytesIO:
+        """Anonymize ``pdf_content`` in the child; blocking, so call it from a thread."""
+        with self.lock:
+            if not self.process.is_alive():
+                logger.warning("Anonymizer process exited, restarting it")
+                self.conn.close()
+                self.start()
+
+            try:
+                self.conn.send_bytes(pdf_content)
+                error = self.conn.recv()
+                if error is None:
+                    return io.BytesIO(self.conn.recv_bytes())
+            except (EOFError, OSError) as e:
+                # The child died mid-file (e.g. out of memory); restarted on next use
+                raise RuntimeError(f"Anonymizer process failed: {e!r}") from e
+
+        raise RuntimeError(error)
+
+
+def anonymize_in_thread(pdf_content: bytes) -> io.BytesIO:
+    """Anonymize ``pdf_content`` in this process, never from two threads at once."""
+    with _THREAD_ANONYMIZE_LOCK:
+        return anonymize_pdf(pdf_content)
+
+
+def get_anonymizer_processes(context):
+    """Return the shared anonymizer processes, or None when anonymization should run in a thread."""
+    global _PROCESSES
+
+    memory_mb = int(getattr(context, "memory_limit_in_mb", 0) or 0)
+    if memory_mb < PROCESS_POOL_MIN_MEMORY_MB:
+        return None
+
+    if _PROCESSES is None:
+        try:
+            _PROCESSES = [AnonymizerProcess() for _ in range(CPU_COUNT)]
+            logger.info("Anonymizer processes started", processes=CPU_COUNT)
+        except (OSError, ValueError) as e:  # ValueError: no forkserver on this platform
+            logger.warning("Anonymizer processes unavailable, using a thread", error=str(e))
+            _PROCESSES = False
+
+    return _PROCESSES or None
+
+
+def get_event_loop():
+    """Return the event loop shared across invocations, creating it if needed.
+
+    The loop is a uvloop (libuv) loop when uvloop is installed, which cuts the
+    per-callback overhead of the S3 transfers.
+    """
+    global _LOOP
+    if _LOOP is None or _LOOP.is_closed():
+        _LOOP = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    return _LOOP
+
+
+def _handle_sigterm(signum, frame):
+    """Close the cached S3 client when the runtime shuts the container down."""
+    loop = _LOOP
+    if os.getpid() == _OWNER_PID and loop is not None and not loop.is_running():
+        loop.run_until_complete(close_s3())
+        loop.close()
+
+    # Chain to whatever handled SIGTERM before us; exit if that was the default
+    previous = _PREVIOUS_SIGTERM
+    if callable(previous):
+        previous(signum, frame)
+    elif previous != signal.SIG_IGN:
+        sys.exit(0)
+
+
+def install_sigterm_handler():
+    """Install the SIGTERM handler once, from the Lambda entry path (not at import)."""
+    global _PREVIOUS_SIGTERM, _SIGTERM_INSTALLED
+    if _SIGTERM_INSTALLED:
+        return
+
+    try:
+        _PREVIOUS_SIGTERM = signal.signal(signal.SIGTERM, _handle_sigterm)
+    except ValueError:
+        return  # Not on the main thread; rely on process teardown
+    _SIGTERM_INSTALLED = True
+
+
+def _s3_object_location(record):
+    """Return (bucket, key) from an S3 event record, or None when a field is malformed."""
+    s3_info = record.get("s3")
+    if not isinstance(s3_info, dict):
+        return None
+
+    bucket_info = s3_info.get("bucket")
+    object_info = s3_info.get("object")
+    if not isinstance(bucket_info, dict) or not isinstance(object_info, dict):
+        return None
+
+    bucket = bucket_info.get("name")
+    key = object_info.get("key")
+    if not isinstance(bucket, str) or not isinstance(key, str):
+        return None
+
+    return bucket, key
+
 
 def parse_s3_event(event):
-    """Parse S3 event to extract PDF files."""
-    records = event.get("Records", [])
-    pdf_files = []
-    
-    for record in records:
+    """Yield (bucket, key) for each PDF object in an S3 event."""
+    for record in event.get("Records", []):
+        # Records are parsed while the pipeline already runs: skip malformed
+        # ones instead of failing the batch halfway through
+        if not isinstance(record, dict):
+            logger.warning("Skipping malformed S3 event record")
+            continue
+
         if record.get("eventSource") == "aws:s3":
-            s3_info = record.get("s3", {})
-            bucket = s3_info.get("bucket", {}).get("name")
-            key = s3_info.get("object", {}).get("key")
-            
+            location = _s3_object_location(record)
+            if location is None:
+                logger.warning("Skipping malformed S3 event record")
+                continue
+
+            bucket, key = location
             if bucket and key:
                 key = urllib.parse.unquote_plus(key)
                 if key.lower().endswith(".pdf"):
-                    pdf_files.append((bucket, key))
-    
-    return pdf_files
+                    yield bucket, key
 
 
-async def process_pdf_file(input_bucket, input_key):
-    """Process a single PDF file."""
-    start_time = time.time()
-    
-    try:
-        # Download PDF
-        pdf_content = await download_pdf(input_bucket, input_key)
-        
-        # Anonymize PDF
-        anonymized_content = anonymize_pdf(pdf_content)
-        
-        # Upload anonymized PDF
-        output_key = generate_output_key(input_key)
-        metadata = {
-            "original-bucket": input_bucket,
-            "original-key": input_key,
-            "processing-timestamp": str(int(time.time())),
-            "anonymized": "true"
-        }
-        
-        await upload_pdf(OUTPUT_BUCKET, output_key, anonymized_content, metadata)
-        
+def error_result(input_bucket, input_key, error, start_time):
+    """Log a failed file and build its result entry."""
+    processing_time = time.time() - start_time
+
+    logger.error(
+        "PDF processing failed",
+        input_bucket=input_bucket,
+        input_key=input_key,
+        error=str(error),
+        processing_time=round(processing_time, 3)
+    )
+
+    return {
+        "status": "error",
+        "input_bucket": input_bucket,
+        "input_key": input_key,
+        "error": str(error),
+        "processing_time": round(processing_time, 3)
+    }
+
+
+async def download_worker(s3, input_queue, anonymize_queue, results):
+    """Stage 1: download PDFs and hand them to the anonymizers."""
+    while (item := await input_queue.get()) is not None:
+        index, input_bucket, input_key = item
+        start_time = time.time()
+
+        try:
+            pdf_content = await download_pdf(input_bucket, input_key, s3)
+        except Exception as e:
+            results[index] = error_result(input_bucket, input_key, e, start_time)
+            continue
+
+        await anonymize_queue.put((index, input_bucket, input_key, start_time, pdf_content))
+
+
+async def anonymize_worker(process, anonymize_queue, upload_queue, results):
+    """Stage 2: anonymize PDFs off the event loop (in ``process`` when given)."""
+    while (item := await anonymize_queue.get()) is not None:
+        index, input_bucket, input_key, start_time, pdf_content = item
+
+        try:
+            if process is not None:
+                anonymized_content = await asyncio.to_thread(process.anonymize, pdf_content)
+            else:
+                anonymized_content = await asyncio.to_thread(anonymize_in_thread, pdf_content)
+        except Exception as e:
+            results[index] = error_result(input_bucket, input_key, e, start_time)
+            continue
+
+        await upload_queue.put(
+            (index, input_bucket, input_key, start_time, len(pdf_content), anonymized_content)
+        )
+
+
+async def upload_worker(s3, upload_queue, results):
+    """Stage 3: upload anonymized PDFs and record the per-file result."""
+    while (item := await upload_queue.get()) is not None:
+        index, input_bucket, input_key, start_time, input_size, anonymized_content = item
+
+        try:
+            output_key = generate_output_key(input_key)
+            metadata = {
+                "original-bucket": input_bucket,
+                "original-key": input_key,
+                "processing-timestamp": str(int(time.time())),
+                "anonymized": "true"
+            }
+
+            await upload_pdf(OUTPUT_BUCKET, output_key, anonymized_content, metadata, s3)
+        except Exception as e:
+            results[index] = error_result(input_bucket, input_key, e, start_time)
+            continue
+
         processing_time = time.time() - start_time
-        
+        output_size = content_size(anonymized_content)
+
         logger.info(
             "PDF processed successfully",
             input_bucket=input_bucket,
@@ -63,119 +309,144 @@ async def process_pdf_file(input_bucket, input_key):
             output_bucket=OUTPUT_BUCKET,
             output_key=output_key,
             processing_time=round(processing_time, 3),
-            input_size=len(pdf_content),
-            output_size=len(anonymized_content)
+            input_size=input_size,
+            output_size=output_size
         )
-        
-        return {
+
+        results[index] = {
             "status": "success",
             "input_bucket": input_bucket,
             "input_key": input_key,
             "output_bucket": OUTPUT_BUCKET,
             "output_key": output_key,
             "processing_time": round(processing_time, 3),
-            "input_size": len(pdf_content),
-            "output_size": len(anonymized_content)
-        }
-        
-    except Exception as e:
-        processing_time = time.time() - start_time
-        
-        logger.error(
-            "PDF processing failed",
-            input_bucket=input_bucket,
-            input_key=input_key,
-            error=str(e),
-            processing_time=round(processing_time, 3)
-        )
-        
-        return {
-            "status": "error",
-            "input_bucket": input_bucket,
-            "input_key": input_key,
-            "error": str(e),
-            "processing_time": round(processing_time, 3)
+            "input_size": input_size,
+            "output_size": output_size
         }
 
 
+async def run_pipeline(s3, processes, pdf_files):
+    """Run the download -> anonymize -> upload pipeline and return results in input order.
+
+    Bounded queues between the stages let the download of file N+1 overlap the
+    anonymization of file N and the upload of file N-1, while keeping at most a
+    few PDFs buffered in memory. ``pdf_files`` may be a lazy iterable: files are
+    dispatched as they are parsed, so the first download starts immediately.
+    """
+    input_queue = asyncio.Queue(maxsize=DOWNLOAD_WORKERS)
+    anonymize_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    upload_queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    results = {}
+
+    downloaders = [
+        asyncio.create_task(download_worker(s3, input_queue, anonymize_queue, results))
+        for _ in range(DOWNLOAD_WORKERS)
+    ]
+    # One anonymizer per child process. PyMuPDF is not thread-safe (and holds
+    # the GIL), so without child processes a single anonymizer runs in a thread
+    anonymizers = [
+        asyncio.create_task(anonymize_worker(process, anonymize_queue, upload_queue, results))
+        for process in (processes or [None])
+    ]
+    uploaders = [
+        asyncio.create_task(upload_worker(s3, upload_queue, results))
+        for _ in range(UPLOAD_WORKERS)
+    ]
+
+    workers = [*downloaders, *anonymizers, *uploaders]
+    try:
+        total = 0
+        for total, (bucket, key) in enumerate(pdf_files, start=1):
+            await input_queue.put((total - 1, bucket, key))
+
+        # Drain each stage in order, then send one sentinel per worker of the next
+        for _ in downloaders:
+            await input_queue.put(None)
+        await asyncio.gather(*downloaders)
+
+        for _ in anonymizers:
+            await anonymize_queue.put(None)
+        await asyncio.gather(*anonymizers)
+
+        for _ in uploaders:
+            await upload_queue.put(None)
+        await asyncio.gather(*uploaders)
+    finally:
+        # The loop outlives this invocation: never leave workers pending on it
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    return [results[index] for index in range(total)]
+
+
 async def async_lambda_handler(event, context):
     """Simple async Lambda handler."""
+    # Pre-warm ping: initialize the execution environment without processing.
+    # Other payloads (even non-dict ones) fall through to the error handling below
+    if isinstance(event, dict) and event.get("warm"):
+        await get_s3()
+        logger.info("Warm-up invocation")
+        return {
+            "statusCode": 200,
+            "body": orjson.dumps({"message": "Warm"}).decode()
+        }
+
     logger.info("Lambda function started", s3_event=event)
 
     try:
-        # Parse S3 event
+        # Parse S3 event lazily; peek once to short-circuit events without PDFs
         pdf_files = parse_s3_event(event)
+        first_file = next(pdf_files, None)
 
-        if not pdf_files:
+        if first_file is None:
             logger.info("No PDF files found in event")
             return {
                 "statusCode": 200,
-                "body": json.dumps({"message": "No PDF files to process"})
+                "body": orjson.dumps({"message": "No PDF files to process"}).decode()
             }
 
-        logger.info("Processing PDF files", count=len(pdf_files))
+        logger.info("Processing PDF files")
 
-        # Process files with limited concurrency
-        semaphore = asyncio.Semaphore(2)
-
-        async def process_with_semaphore(bucket, key):
-            async with semaphore:
-                return await process_pdf_file(bucket, key)
-
-        # Execute all processing tasks
-        tasks = [process_with_semaphore(bucket, key) for bucket, key in pdf_files]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # Process results
-        processed_results = []
-        successful = 0
-        failed = 0
+        # Reuse the cached S3 client (and its keep-alive connections) for the batch
+        processes = get_anonymizer_processes(context)
+        s3 = await get_s3()
+        processed_results = await run_pipeline(
+            s3, processes, itertools.chain([first_file], pdf_files)
+        )
 
-        for result in results:
-            if isinstance(result, Exception):
-                result_dict = {
-                    "status": "error",
-                    "error": str(result),
-                    "error_type": type(result).__name__
-                }
-                failed += 1
-            else:
-                result_dict = result
-                if isinstance(result_dict, dict) and result_dict.get("status") == "success":
-                    successful += 1
-                else:
-                    failed += 1
-            
-            processed_results.append(result_dict)
+        successful = sum(1 for r in processed_results if r["status"] == "success")
+        failed = len(processed_results) - successful
 
         logger.info(
             "Lambda processing completed",
-            total_files=len(pdf_files),
+            total_files=len(processed_results),
             successful=successful,
             failed=failed
         )
 
         return {
             "statusCode": 200 if failed == 0 else 207,
-            "body": json.dumps({
+            "body": orjson.dumps({
                 "message": "PDF processing completed",
                 "summary": {
-                    "total_files": len(pdf_files),
+                    "total_files": len(processed_results),
                     "successful": successful,
                     "failed": failed
                 },
                 "results": processed_results
-            }, indent=2)
+            }, option=orjson.OPT_INDENT_2).decode()
         }
 
     except Exception as e:
         logger.error("Lambda function failed", error=str(e))
         return {
             "statusCode": 500,
-            "body": json.dumps({"error": "Internal server error", "message": str(e)})
+            "body": orjson.dumps({"error": "Internal server error", "message": str(e)}).decode()
         }
 
 
 def lambda_handler(event, context):
     """Main Lambda handler entry point."""
-    return asyncio.run(async_lambda_handler(event, context))
+    install_sigterm_handler()
+    return get_event_loop().run_until_complete(async_lambda_handler(event, context))
@@ -1,53 +1,97 @@
 """Simple PDF anonymization based on original main.py logic."""
 
+from __future__ import annotations
+
+import functools
 import io
-import fitz  # PyMuPDF
-from typing import List, Tuple
-from PIL import Image, ImageDraw
+from typing import TYPE_CHECKING, List, Tuple
 import structlog
 
 from .config import (
     LINE_TOLERANCE,
     PREVLINE_TOLERANCE,
     PADDING,
-    LABELS_SAME_LINE,
-    KEEP_LABELS,
+    LABEL_KINDS,
     CRM_TOKENS,
     PAGE1_REDACT_COORDS,
     PAGE2_REDACT_COORDS,
     DPI_PAGE2_RENDER,
+    PAGE2_GRAYSCALE,
+    IMAGE_FORMAT,
+    JPEG_QUALITY,
     IMAGE_REDACT_MODE,
 )
 
+if TYPE_CHECKING:
+    import fitz  # PyMuPDF
+
 logger = structlog.get_logger(__name__)
 
+# PyMuPDF is imported inside the functions that need it at runtime: it is a
+# large native library, and the handler process only loads it once a PDF is
+# anonymized there (never, when the work goes to the anonymizer child processes).
+
+# Document.save options: drop unreferenced objects left behind by redaction,
+# compress every uncompressed stream (including images and fonts) and sanitize
+# content streams, so fewer bytes go to S3
+SAVE_OPTIONS = {
+    "garbage": 4,
+    "deflate": True,
+    "deflate_images": True,
+    "deflate_fonts": True,
+    "clean": True,
+}
+
 
 def clamp01(v: float) -> float:
     """Clamp coordinate value to 0-1 range."""
     return max(0.0, min(1.0, float(v)))
 
 
-def to_abs_rect(page: fitz.Page, rel_rect) -> fitz.Rect:
-    """Convert relative coordinates to absolute rectangle."""
+def to_abs_rect(x0: float, y0: float, width: float, height: float, rel_rect) -> fitz.Rect:
+    """Convert relative coordinates to an absolute rectangle within the given bounds."""
+    import fitz
+
     x0r, y0r, x1r, y1r = [clamp01(v) for v in rel_rect]
     if x1r < x0r:
         x0r, x1r = x1r, x0r
     if y1r < y0r:
         y0r, y1r = y1r, y0r
-    b = page.bound()
     return fitz.Rect(
-        b.x0 + b.width * x0r,
-        b.y0 + b.height * y0r,
-        b.x0 + b.width * x1r,
-        b.y0 + b.height * y1r,
+        x0 + width * x0r,
+        y0 + height * y0r,
+        x0 + width * x1r,
+        y0 + height * y1r,
     )
 
 
-def render_page_to_image(page: fitz.Page, dpi: int) -> Image.Image:
-    """Render PDF page to PIL Image."""
+@functools.lru_cache(maxsize=8)
+def resolve_redact_rects(
+    x0: float, y0: float, width: float, height: float, coords: tuple
+) -> Tuple[fitz.Rect, ...]:
+    """Resolve a tuple of relative coordinates once per page/pixmap size.
+
+    ECG exports share a handful of page sizes, so the per-document path is a
+    cache hit. Callers must not mutate the returned rectangles.
+    """
+    return tuple(to_abs_rect(x0, y0, width, height, rel_rect) for rel_rect in coords)
+
+
+def page1_redact_rects(page: fitz.Page) -> Tuple[fitz.Rect, ...]:
+    """Absolute page-1 redaction rectangles for this page's bounds."""
+    b = page.bound()
+    return resolve_redact_rects(b.x0, b.y0, b.width, b.height, PAGE1_REDACT_COORDS)
+
+
+def render_page_to_pixmap(page: fitz.Page, dpi: int, grayscale: bool = False) -> fitz.Pixmap:
+    """Render PDF page to an RGB (or grayscale) Pixmap."""
+    import fitz
+
     zoom = dpi / 72.0
-    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
-    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    colorspace = fitz.csGRAY if grayscale else fitz.csRGB
+    return page.get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom), colorspace=colorspace, alpha=False
+    )
 
 
 def clear_pdf_metadata(doc: fitz.Document) -> None:
@@ -59,25 +103,10 @@ def clear_pdf_metadata(doc: fitz.Document) -> None:
     if current_metadata:
         logger.debug("Current metadata", metadata_keys=list(current_metadata.keys()))
     
-    # Clear all standard metadata fields using PyMuPDF's method
-    metadata_to_clear = {
-        'title': '',
-        'author': '',
-        'subject': '',
-        'keywords': '',
-        'creator': '',
-        'producer': '',
-        'creationDate': '',
-        'modDate': '',
-        'trapped': ''
-    }
-    
-    # Use PyMuPDF's metadata setting method
+    # Clear all standard metadata fields; an empty dict removes the Info
+    # dictionary entries (assigning into doc.metadata only edits a copy)
     try:
-        # Set metadata using the document's metadata property
-        if doc.metadata is not None:
-            for key, value in metadata_to_clear.items():
-                doc.metadata[key] = value
+        doc.set_metadata({})
     except Exception as e:
         logger.warning("Could not clear standard metadata", error=str(e))
     
@@ -95,51 +124,27 @@ def clear_pdf_metadata(doc: fitz.Document) -> None:
     except Exception as e:
         logger.warning("Could not clear XMP metadata", error=str(e))
     
-    # Also try to remove any custom metadata/properties
-    try:
-        # Clear document info dictionary if accessible
-        info_dict = doc.pdf_catalog()
-        if info_dict and 'Info' in info_dict:
-            # Remove Info reference
-            del info_dict['Info']
-    except Exception as e:
-        logger.warning("Could not clear extended metadata", error=str(e))
-    
-    # Additional cleanup: try to remove metadata streams
-    try:
-        # Iterate through all objects and remove metadata streams
-        for page_num in range(len(doc)):
-            page = doc[page_num]
-            # Remove page-level metadata if any
-            try:
-                page_dict = page.get_contents()
-                if page_dict and isinstance(page_dict, list):
-                    for content in page_dict:
-                        if hasattr(content, 'metadata'):
-                            content.metadata = None
-            except Exception:
-                pass  # Page-level metadata removal is optional
-    except Exception as e:
-        logger.warning("Could not clear page-level metadata", error=str(e))
-    
-    logger.info("PDF metadata clearing completed - standard, XMP, and extended metadata processed")
+    logger.info("PDF metadata clearing completed - standard and XMP metadata processed")
 
 
 def words_by_line(page) -> List[List[Tuple[float, float, float, float, str]]]:
     """Extract and group words by text lines."""
-    words = page.get_text("words")  # [x0,y0,x1,y1,text,...]
-    words = [w for w in words if w[4].strip()]
+    # Slice each word to (x0, y0, x1, y1, text) once, while filtering
+    words = [w[:5] for w in page.get_text("words") if w[4].strip()]
     words.sort(key=lambda w: (round(w[1], 1), w[0]))
+    tolerance = LINE_TOLERANCE
     lines, current, prev_y = [], [], None
     for w in words:
         y0 = w[1]
-        if prev_y is None or abs(y0 - prev_y) <= LINE_TOLERANCE:
-            current.append((w[0], w[1], w[2], w[3], w[4]))
-            prev_y = y0 if prev_y is None else (prev_y + y0) / 2.0
+        if prev_y is None:
+            current.append(w)
+            prev_y = y0
+        elif abs(y0 - prev_y) <= tolerance:
+            current.append(w)
+            prev_y = (prev_y + y0) / 2.0
         else:
-            if current:
-                lines.append(current)
-            current = [(w[0], w[1], w[2], w[3], w[4])]
+            lines.append(current)
+            current = [w]
             prev_y = y0
     if current:
         lines.append(current)
@@ -148,6 +153,8 @@ def words_by_line(page) -> List[List[Tuple[float, float, float, float, str]]]:
 
 def rect_of_words(words_line, start_idx, end_idx) -> fitz.Rect:
     """Create rectangle from word range."""
+    import fitz
+
     xs0 = [w[0] for w in words_line[start_idx:end_idx]]
     ys0 = [w[1] for w in words_line[start_idx:end_idx]]
     xs1 = [w[2] for w in words_line[start_idx:end_idx]]
@@ -157,51 +164,54 @@ def rect_of_words(words_line, start_idx, end_idx) -> fitz.Rect:
     )
 
 
-def redact_line_values_after_label(page, labels_set):
+def redact_line_values_after_label(page):
     """Redact values after specific labels - WORKING LOGIC FROM debug_redaction.py"""
     lines = words_by_line(page)
-    
-    for line_num, line in enumerate(lines):
-        texts = [w[4] for w in line]
-        
-        for i, tok in enumerate(texts):
-            tok_norm = tok if tok.endswith(":") else (tok + ":")
-            
-            if tok_norm in labels_set and tok_norm not in KEEP_LABELS:
-                start_idx = i + 1
-                if start_idx >= len(line):
-                    continue
-                
-                end_idx = len(line)
-                
-                # Look for next label
-                for j in range(start_idx, len(texts)):
-                    t_norm = texts[j] if texts[j].endswith(":") else (texts[j] + ":")
-                    if t_norm in labels_set or t_norm in KEEP_LABELS:
-                        end_idx = j
-                        break
-                
-                if end_idx > start_idx:
-                    # Calculate rectangle and add redaction
-                    rect = rect_of_words(line, start_idx, end_idx)
-                    page.add_redact_annot(rect, fill=(0, 0, 0))
+
+    for line in lines:
+        # Classify every token once: "redact"/"keep" label, or None for a value
+        kinds = [LABEL_KINDS.get(w[4]) for w in line]
+
+        for i, kind in enumerate(kinds):
+            if kind != "redact":
+                continue
+
+            start_idx = i + 1
+            if start_idx >= len(line):
+                continue
+
+            end_idx = len(line)
+
+            # Look for next label
+            for j in range(start_idx, len(kinds)):
+                if kinds[j] is not None:
+                    end_idx = j
+                    break
+
+            if end_idx > start_idx:
+                # Calculate rectangle and add redaction
+                rect = rect_of_words(line, start_idx, end_idx)
+                page.add_redact_annot(rect, fill=(0, 0, 0))
 
 
 def redact_crm_and_upper_name(page):
     """Redact CRM tokens and signature lines above them."""
+    import fitz
+
     lines = words_by_line(page)
+    crm_rects = []
     # Redact "CRM" and everything to the right
     for line in lines:
-        texts = [w[4] for w in line]
-        for i, tok in enumerate(texts):
+        for i, w in enumerate(line):
+            tok = w[4]
             if tok.strip() in CRM_TOKENS:
                 page.add_redact_annot(rect_of_words(line, i, len(line)), fill=(0, 0, 0))
+            # Anchor words for the signature check below: the same case-insensitive
+            # substring hits page.search_for gave, without re-tokenizing the page
+            if "crm" in tok.lower():
+                crm_rects.append(fitz.Rect(w[:4]))
 
     # Redact the line above CRM (signature), if not a label
-    crm_rects = []
-    for label in CRM_TOKENS:
-        for r in page.search_for(label, quads=False):
-            crm_rects.append(r)
     if not crm_rects:
         return
     line_rects = []
@@ -224,55 +234,24 @@ def redact_crm_and_upper_name(page):
 
 def anonymize_text_on_page1(page1: fitz.Page):
     """Apply text-based anonymization to page 1."""
-    # Include ALL labels (SAME_LINE + KEEP) for proper next-label detection
-    # The redaction logic will filter out KEEP_LABELS automatically
-    labels_set = set(LABELS_SAME_LINE + KEEP_LABELS)
-    redact_line_values_after_label(page1, labels_set)
+    # LABEL_KINDS holds ALL labels (SAME_LINE + KEEP) for proper next-label detection;
+    # only "redact" labels have their values removed
+    redact_line_values_after_label(page1)
     redact_crm_and_upper_name(page1)
 
 
-def anonymize_single_page_pdf(doc: fitz.Document) -> bytes:
+def anonymize_single_page_pdf(doc: fitz.Document) -> io.BytesIO:
     """Anonymize PDF with only 1 page - WORKING LOGIC FROM debug_redaction.py"""
     logger.info("Processing single-page PDF")
 
     page1 = doc[0]
     
-    # Apply the EXACT working logic from debug_redaction.py
-    lines = words_by_line(page1)
-    labels_set = set(LABELS_SAME_LINE + KEEP_LABELS)
-    
-    # Add text-based redactions using the working logic
-    for line_num, line in enumerate(lines):
-        texts = [w[4] for w in line]
-        
-        for i, tok in enumerate(texts):
-            tok_norm = tok if tok.endswith(":") else (tok + ":")
-            
-            if tok_norm in labels_set and tok_norm not in KEEP_LABELS:
-                start_idx = i + 1
-                if start_idx >= len(line):
-                    continue
-                
-                end_idx = len(line)
-                
-                # Look for next label
-                for j in range(start_idx, len(texts)):
-                    t_norm = texts[j] if texts[j].endswith(":") else (texts[j] + ":")
-                    if t_norm in labels_set or t_norm in KEEP_LABELS:
-                        end_idx = j
-                        break
-                
-                if end_idx > start_idx:
-                    # Calculate rectangle and add redaction
-                    rect = rect_of_words(line, start_idx, end_idx)
-                    page1.add_redact_annot(rect, fill=(0, 0, 0))
-    
-    # Apply CRM redactions
-    redact_crm_and_upper_name(page1)
+    # Apply text-based and CRM redactions (same logic as multi-page page 1)
+    anonymize_text_on_page1(page1)
 
     # Apply coordinate-based redaction for page 1
-    for coords in PAGE1_REDACT_COORDS:
-        page1.add_redact_annot(to_abs_rect(page1, coords), fill=(0, 0, 0))
+    for rect in page1_redact_rects(page1):
+        page1.add_redact_annot(rect, fill=(0, 0, 0))
 
     # Apply all redactions (preserve vector format)
     page1.apply_redactions()
@@ -282,14 +261,17 @@ def anonymize_single_page_pdf(doc: fitz.Document) -> bytes:
 
     # Save and return the modified PDF
     output_buffer = io.BytesIO()
-    doc.save(output_buffer)
+    doc.save(output_buffer, **SAVE_OPTIONS)
+    output_buffer.seek(0)
 
     logger.info("Single-page PDF anonymization completed")
-    return output_buffer.getvalue()
+    return output_buffer
 
 
-def anonymize_multi_page_pdf(doc: fitz.Document) -> bytes:
+def anonymize_multi_page_pdf(doc: fitz.Document) -> io.BytesIO:
     """Anonymize PDF with 2+ pages using full method (page1 + rasterized page2)."""
+    import fitz
+
     logger.info("Processing multi-page PDF", pages=len(doc))
 
     # Process Page 1: Text + Coordinate redaction (preserve vector)
@@ -299,58 +281,58 @@ def anonymize_multi_page_pdf(doc: fitz.Document) -> bytes:
     anonymize_text_on_page1(page1)
 
     # Apply coordinate-based redaction
-    for coords in PAGE1_REDACT_COORDS:
-        page1.add_redact_annot(to_abs_rect(page1, coords), fill=(0, 0, 0))
+    for rect in page1_redact_rects(page1):
+        page1.add_redact_annot(rect, fill=(0, 0, 0))
 
     # Apply all redactions
     page1.apply_redactions()
 
-    # Create output PDF with page 1
+    # Create output PDF with page 1. A fresh document only receives what
+    # insert_pdf copies for that page: the outline, the form fields of the other
+    # pages, name trees, attachments and the rest of the source catalog stay behind
     output_doc = fitz.open()
     output_doc.insert_pdf(doc, from_page=0, to_page=0)
 
     # Process Page 2: Rasterize and apply coordinate redaction
     page2 = doc[1]
 
-    # Render page 2 to image
-    img = render_page_to_image(page2, DPI_PAGE2_RENDER)
-    draw = ImageDraw.Draw(img)
+    # Render page 2 straight to a Pixmap (no PIL copy or PNG decode round-trip)
+    pix = render_page_to_pixmap(page2, DPI_PAGE2_RENDER, PAGE2_GRAYSCALE)
+    black = (0,) * pix.n
 
-    # Apply coordinate redaction on the image
-    for coords in PAGE2_REDACT_COORDS:
-        # Convert relative coordinates to absolute pixel coordinates
-        x1 = int(coords[0] * img.width)
-        y1 = int(coords[1] * img.height)
-        x2 = int(coords[2] * img.width)
-        y2 = int(coords[3] * img.height)
+    # Apply coordinate redaction directly on the Pixmap samples
+    for rect in resolve_redact_rects(0, 0, pix.width, pix.height, PAGE2_REDACT_COORDS):
+        # Fill black rectangle, rounded outwards to whole pixels
+        pix.set_rect(rect.irect, black)
 
-        # Draw black rectangle
-        draw.rectangle([x1, y1, x2, y2], fill=(0, 0, 0))
-
-    # Convert image back to PDF page
-    img_buffer = io.BytesIO()
-    img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
-
-    # Create new page from image using proper method
-    page2_rect = fitz.Rect(0, 0, img.width, img.height)
+    # Create new page from the rendered Pixmap (JPEG by default: the trace is
+    # continuous-tone, and the DCT stream is embedded without re-encoding)
+    page2_rect = fitz.Rect(0, 0, pix.width, pix.height)
     new_page = output_doc.new_page(width=page2_rect.width, height=page2_rect.height)
-    new_page.insert_image(page2_rect, stream=img_buffer.getvalue())
+    new_page.insert_image(
+        page2_rect, stream=pix.tobytes(IMAGE_FORMAT, jpg_quality=JPEG_QUALITY)
+    )
 
     # Clear PDF metadata for privacy
     clear_pdf_metadata(output_doc)
 
     # Save final PDF
     output_buffer = io.BytesIO()
-    output_doc.save(output_buffer)
+    output_doc.save(output_buffer, **SAVE_OPTIONS)
+    output_buffer.seek(0)
     output_doc.close()
 
     logger.info("Multi-page PDF anonymization completed")
-    return output_buffer.getvalue()
+    return output_buffer
+
+
+def anonymize_pdf(pdf_content: bytes) -> io.BytesIO:
+    """Main anonymization function with conditional logic based on page count.
 
+    Returns the anonymized PDF as a rewound buffer that can be passed to S3 as-is.
+    """
+    import fitz
 
-def anonymize_pdf(pdf_content: bytes) -> bytes:
-    """Main anonymization function with conditional logic based on page count."""
     logger.info("Starting PDF anonymization", pdf_size=len(pdf_content))
 
     # Open PDF
@@ -1,51 +1,175 @@
 """Simple S3 utilities for PDF processing."""
 
 import asyncio
+import io
+import secrets
+import time
+from typing import Any
 import aioboto3
 import structlog
+from botocore.config import Config
 from botocore.exceptions import ClientError
-from ulid import new
-from .config import AWS_REGION
+from .config import (
+    AWS_REGION,
+    S3_MAX_POOL_CONNECTIONS,
+    S3_MAX_ATTEMPTS,
+    S3_RANGE_CHUNK_SIZE,
+    S3_MULTIPART_PART_SIZE,
+    S3_MULTIPART_CONCURRENCY,
+)
 
 logger = structlog.get_logger(__name__)
 
+# S3 client kept in module scope so every call (and every warm invocation)
+# reuses its credentials and keep-alive connections instead of reconnecting
+_SESSION = aioboto3.Session()
+_S3_CLIENT_CM = None
+_S3_CLIENT = None
+
+S3_CLIENT_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+    # botocore owns retries: adaptive mode backs off on throttling via its token bucket
+    retries={"mode": "adaptive", "total_max_attempts": S3_MAX_ATTEMPTS},
+)
+
+
+async def get_s3():
+    """Return the cached S3 client, entering its context on first use."""
+    global _S3_CLIENT_CM, _S3_CLIENT
+    if _S3_CLIENT is None:
+        _S3_CLIENT_CM = _SESSION.client(
+            "s3", region_name=AWS_REGION, config=S3_CLIENT_CONFIG
+        )
+        _S3_CLIENT = await _S3_CLIENT_CM.__aenter__()
+    return _S3_CLIENT
+
+
+async def close_s3():
+    """Close the cached S3 client, if any."""
+    global _S3_CLIENT_CM, _S3_CLIENT
+    if _S3_CLIENT_CM is not None:
+        await _S3_CLIENT_CM.__aexit__(None, None, None)
+    _S3_CLIENT_CM, _S3_CLIENT = None, None
+
+
+async def download_pdf(bucket: str, key: str, s3=None) -> bytes | bytearray:
+    """Download PDF from S3 (``s3`` defaults to the cached client)."""
+    if s3 is None:
+        s3 = await get_s3()
 
-async def download_pdf(bucket: str, key: str) -> bytes:
-    """Download PDF from S3."""
     logger.info("Downloading PDF from S3", bucket=bucket, key=key)
 
-    session = aioboto3.Session()
-    async with session.client("s3", region_name=AWS_REGION) as s3:
-        try:
-            response = await s3.get_object(Bucket=bucket, Key=key)
-            content = await response["Body"].read()
+    try:
+        content = await download_ranges(s3, bucket, key)
 
-            logger.info(
-                "Successfully downloaded PDF", bucket=bucket, key=key, size=len(content)
-            )
-            return content
+        logger.info(
+            "Successfully downloaded PDF", bucket=bucket, key=key, size=len(content)
+        )
+        return content
 
-        except ClientError as e:
-            error_code = e.response.get("Error", {}).get("Code", "Unknown")
-            logger.error(
-                "Failed to download PDF", bucket=bucket, key=key, error=error_code
-            )
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code", "Unknown")
+        logger.error(
+            "Failed to download PDF", bucket=bucket, key=key, error=error_code
+        )
+        raise
+
+
+async def read_range(s3, bucket: str, key: str, start: int, end: int, etag: str) -> bytes:
+    """Read bytes ``start``-``end`` (inclusive) of an object, pinned to ``etag``."""
+    response = await s3.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={start}-{end}", IfMatch=etag
+    )
+    return await response["Body"].read()
+
+
+async def download_ranges(s3, bucket: str, key: str) -> bytes | bytearray:
+    """Download an object, fetching anything past the first chunk concurrently.
+
+    The first request asks for one S3_RANGE_CHUNK_SIZE range, which is the whole
+    object for typical PDFs; its Content-Range gives the total size, so no
+    HEAD request is needed to plan the remaining ranges. Larger objects are
+    assembled in one preallocated buffer, so memory peaks near the object size.
+    """
+    chunk = S3_RANGE_CHUNK_SIZE
+    try:
+        response = await s3.get_object(Bucket=bucket, Key=key, Range=f"bytes=0-{chunk - 1}")
+    except ClientError as e:
+        # Empty objects have no satisfiable range
+        if e.response.get("Error", {}).get("Code") != "InvalidRange":
             raise
+        response = await s3.get_object(Bucket=bucket, Key=key)
+        return await response["Body"].read()
+
+    first = await response["Body"].read()
+    content_range = response.get("ContentRange")
+    if content_range is None:
+        # The range was not honoured (or the header was dropped). Any body but
+        # a full chunk is the whole object; otherwise read it in one plain GET
+        if len(first) != chunk:
+            return first
+        response = await s3.get_object(Bucket=bucket, Key=key)
+        return await response["Body"].read()
+
+    size = int(content_range.rsplit("/", 1)[1])
+    if size <= chunk:
+        return first
+
+    buffer = bytearray(size)
+    # Writes go through a memoryview, which (unlike the bytearray) raises on a
+    # short range instead of silently resizing the buffer
+    with memoryview(buffer) as view:
+        view[:chunk] = first
+        del first
+
+        async def fill(start: int, end: int) -> None:
+            # IfMatch makes S3 reject the ranges if the object is replaced mid-download
+            view[start:end + 1] = await read_range(
+                s3, bucket, key, start, end, response["ETag"]
+            )
+
+        await asyncio.gather(*(
+            fill(start, min(start + chunk, size) - 1) for start in range(chunk, size, chunk)
+        ))
+    return buffer
+
+
+def content_size(content: bytes | io.BytesIO) -> int:
+    """Size in bytes of an in-memory PDF, without copying a buffer."""
+    if isinstance(content, io.BytesIO):
+        return content.getbuffer().nbytes
+    return len(content)
 
 
 async def upload_pdf(
-    bucket: str, key: str, content: bytes, metadata: dict | None = None
+    bucket: str,
+    key: str,
+    content: bytes | io.BytesIO,
+    metadata: dict | None = None,
+    s3=None,
 ) -> None:
-    """Upload PDF to S3."""
-    logger.info("Uploading PDF to S3", bucket=bucket, key=key, size=len(content))
+    """Upload PDF to S3 (``s3`` defaults to the cached client).
 
-    session = aioboto3.Session()
-    async with session.client("s3", region_name=AWS_REGION) as s3:
-        try:
-            upload_params = {
+    ``content`` may be a rewound ``io.BytesIO``; it is streamed as the request
+    body instead of being copied into a ``bytes`` object first.
+    """
+    if s3 is None:
+        s3 = await get_s3()
+
+    size = content_size(content)
+    logger.info("Uploading PDF to S3", bucket=bucket, key=key, size=size)
+
+    try:
+        if size > S3_MULTIPART_PART_SIZE:
+            await multipart_upload(s3, bucket, key, content, metadata)
+        else:
+            upload_params: dict[str, Any] = {
                 "Bucket": bucket,
                 "Key": key,
                 "Body": content,
+                # Explicit length so botocore does not have to seek/scan the body
+                "ContentLength": size,
                 "ContentType": "application/pdf",
             }
 
@@ -54,31 +178,91 @@ async def upload_pdf(
 
             await s3.put_object(**upload_params)
 
-            logger.info("Successfully uploaded PDF", bucket=bucket, key=key)
+        logger.info("Successfully uploaded PDF", bucket=bucket, key=key)
+
+    except ClientError as e:
+        error_code = e.response.get("Error", {}).get("Code", "Unknown")
+        logger.error(
+            "Failed to upload PDF", bucket=bucket, key=key, error=error_code
+        )
+        raise
+
+
+async def upload_part(
+    s3, semaphore, bucket: str, key: str, upload_id: str, number: int, data: memoryview
+) -> dict:
+    """Upload one multipart part and return its entry for the completion call."""
+    async with semaphore:
+        # Copy the slice only once a slot is free, bounding the extra memory
+        response = await s3.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=bytes(data)
+        )
+    return {"ETag": response["ETag"], "PartNumber": number}
 
-        except ClientError as e:
-            error_code = e.response.get("Error", {}).get("Code", "Unknown")
+
+async def multipart_upload(
+    s3, bucket: str, key: str, content: bytes | io.BytesIO, metadata: dict | None = None
+) -> None:
+    """Upload ``content`` as concurrent multipart parts, aborting on failure."""
+    params: dict[str, Any] = {"Bucket": bucket, "Key": key, "ContentType": "application/pdf"}
+    if metadata:
+        params["Metadata"] = metadata
+
+    upload_id = (await s3.create_multipart_upload(**params))["UploadId"]
+    view = content.getbuffer() if isinstance(content, io.BytesIO) else memoryview(content)
+    semaphore = asyncio.Semaphore(S3_MULTIPART_CONCURRENCY)
+    part_size = S3_MULTIPART_PART_SIZE
+
+    tasks = [
+        asyncio.create_task(
+            upload_part(s3, semaphore, bucket, key, upload_id, number, view[start:start + part_size])
+        )
+        for number, start in enumerate(range(0, len(view), part_size), start=1)
+    ]
+
+    try:
+        parts = await asyncio.gather(*tasks)
+        await s3.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        # gather leaves the other parts running on failure: stop them first, so
+        # no part lands after the abort (also on cancellation)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # Drop the uploaded parts so they are not billed as storage
+        logger.warning("Aborting multipart upload", bucket=bucket, key=key)
+        try:
+            await s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception as e:
+            # Keep the original error; a failed abort must not mask it
             logger.error(
-                "Failed to upload PDF", bucket=bucket, key=key, error=error_code
+                "Failed to abort multipart upload",
+                bucket=bucket,
+                key=key,
+                upload_id=upload_id,
+                error=str(e),
             )
-            raise
+        raise
+
+
+def unique_id() -> str:
+    """Time-sortable unique id: 48-bit millisecond timestamp + 80 random bits, in hex."""
+    return f"{time.time_ns() // 1_000_000:012x}{secrets.token_hex(10)}"
 
 
 def generate_output_key(input_key: str, prefix: str = "anonymized") -> str:
-    """Generate output key using ULID for unique filename."""
-    # Generate a new ULID for unique filename
-    ulid = str(new())
+    """Generate output key using a time-sortable unique id for the filename."""
+    # Generate a new unique id for the filename
+    file_id = unique_id()
 
-    # Extract file extension from input key
-    if "." in input_key:
-        _, ext = input_key.rsplit(".", 1)
-        filename = f"{prefix}_{ulid}.{ext}"
-    else:
-        filename = f"{prefix}_{ulid}.pdf"  # Default to PDF if no extension
+    # Split off the directory and the extension in one right-to-left pass each;
+    # the extension is only looked for in the filename, never in the directory
+    path, sep, name = input_key.rpartition("/")
+    _, dot, ext = name.rpartition(".")
+    filename = f"{prefix}_{file_id}.{ext if dot else 'pdf'}"  # Default to PDF if no extension
 
     # Preserve directory structure if present
-    if "/" in input_key:
-        path, _ = input_key.rsplit("/", 1)
-        return f"{path}/{filename}"
-    else:
-        return filename
+    return f"{path}/{filename}" if sep else filename
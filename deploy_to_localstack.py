@@ -11,6 +11,48 @@ import tempfile
 import subprocess
 from pathlib import Path
 
+# Arquivos que não são usados em runtime e só aumentam o pacote e o cold start
+EXCLUDED_DIRS = {'__pycache__', 'tests', 'test', 'examples'}
+EXCLUDED_SUFFIXES = {'.pyc', '.pyi', '.c', '.h', '.debug'}
+# Dos metadados de pacote (*.dist-info) só o METADATA é mantido,
+# para que importlib.metadata.version() continue funcionando
+KEPT_DIST_INFO_FILES = {'METADATA'}
+# Modelos de serviço do botocore mantidos (o restante de botocore/data é descartado)
+BOTOCORE_SERVICES = {'s3', 'lambda', 'dynamodb', 'sts'}
+# Bytecode gerado por compile_dependencies (só é usado pelo Lambda se a versão
+# do Python que faz o deploy for a mesma do runtime)
+BYTECODE_SUFFIX = f'.{sys.implementation.cache_tag}.pyc'
+
+def compile_dependencies(deps_dir: str):
+    """Pré-compilar as dependências para bytecode
+
+    /var/task é somente leitura no Lambda: sem os .pyc no pacote, cada cold start
+    recompila todos os módulos importados. unchecked-hash faz o runtime usar o
+    .pyc sem comparar com o mtime do .py, que o ZIP não preserva com exatidão.
+    """
+    subprocess.run([
+        sys.executable, '-m', 'compileall',
+        '-q', '-j', '0',
+        '--invalidation-mode', 'unchecked-hash',
+        deps_dir
+    ], check=True)
+
+def should_package(relative_path: Path) -> bool:
+    """Indicar se um arquivo das dependências deve entrar no ZIP"""
+    parts = relative_path.parts
+    is_bytecode = parts[-2:-1] == ('__pycache__',) and relative_path.name.endswith(BYTECODE_SUFFIX)
+    if is_bytecode:
+        return not any(part in EXCLUDED_DIRS for part in parts[:-2])
+    if any(part in EXCLUDED_DIRS for part in parts[:-1]):
+        return False
+    if relative_path.suffix in EXCLUDED_SUFFIXES:
+        return False
+    if parts[0].endswith('.dist-info'):
+        return relative_path.name in KEPT_DIST_INFO_FILES
+    if parts[:2] == ('botocore', 'data') and len(parts) > 3:
+        return parts[2] in BOTOCORE_SERVICES
+    return True
+
 def create_lambda_package():
     """Criar pacote ZIP da função Lambda"""
     print("📦 Criando pacote Lambda...")
@@ -22,7 +64,7 @@ def create_lambda_package():
     with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_file:
         zip_path = tmp_file.name
     
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zip_file:
         
         # Adicionar módulo bp_ecg_etl
         bp_ecg_etl_dir = project_dir / 'bp_ecg_etl'
@@ -45,24 +87,52 @@ def create_lambda_package():
                 '--no-deps'  # Evitar dependências desnecessárias
             ], check=True, capture_output=True)
             
-            # Adicionar dependências ao ZIP
+            print("   ⚙️  Pré-compilando dependências...")
+            compile_dependencies(deps_dir)
+            
+            # Adicionar dependências ao ZIP, sem testes e metadados
             deps_path = Path(deps_dir)
+            skipped = 0
             for item in deps_path.rglob('*'):
-                if item.is_file() and '__pycache__' not in str(item):
+                if item.is_file():
                     arcname = item.relative_to(deps_path)
-                    zip_file.write(item, arcname)
+                    if should_package(arcname):
+                        zip_file.write(item, arcname)
+                    else:
+                        skipped += 1
+            print(f"   🧹 Arquivos descartados das dependências: {skipped}")
     
     print(f"✅ Pacote criado: {zip_path}")
     return zip_path
 
-def deploy_to_localstack(zip_path: str):
-    """Fazer deploy da função para LocalStack"""
+def build_lambda_image(image_uri: str) -> str:
+    """Construir a imagem de container da função Lambda (ver Dockerfile)"""
+    print(f"🐳 Construindo imagem Lambda: {image_uri}")
+    
+    project_dir = Path(__file__).parent
+    subprocess.run([
+        'docker', 'build',
+        '--platform', 'linux/amd64',
+        '--provenance=false',  # Lambda não aceita manifest lists
+        '-t', image_uri,
+        str(project_dir)
+    ], check=True)
+    
+    # Imagens com registry (ex.: ECR do LocalStack) precisam ser enviadas
+    if '/' in image_uri:
+        subprocess.run(['docker', 'push', image_uri], check=True)
+    
+    print(f"✅ Imagem criada: {image_uri}")
+    return image_uri
+
+def deploy_to_localstack(zip_path: str | None = None, image_uri: str | None = None):
+    """Fazer deploy da função para LocalStack (ZIP ou imagem de container)"""
     print("🚀 Fazendo deploy para LocalStack...")
     
     # Configurações da função Lambda
     function_name = "bp-ecg-etl-anonymizer"
     handler = "bp_ecg_etl.main.lambda_handler"
-    runtime = "python3.9"
+    runtime = "python3.12"
     timeout = 300  # 5 minutos
     memory_size = 1024  # 1GB
     
@@ -82,6 +152,14 @@ def deploy_to_localstack(zip_path: str):
     # Endpoint do LocalStack
     localstack_endpoint = "http://localhost:4566"
     
+    # Código da função: a imagem já define runtime e handler (CMD do Dockerfile)
+    if image_uri:
+        code_args = ['--image-uri', image_uri]
+        create_args = ['--package-type', 'Image', '--code', f'ImageUri={image_uri}']
+    else:
+        code_args = ['--zip-file', f'fileb://{zip_path}']
+        create_args = ['--runtime', runtime, '--handler', handler, *code_args]
+    
     try:
         # Verificar se a função já existe
         print("🔍 Verificando se função já existe...")
@@ -97,7 +175,7 @@ def deploy_to_localstack(zip_path: str):
             subprocess.run([
                 'aws', 'lambda', 'update-function-code',
                 '--function-name', function_name,
-                '--zip-file', f'fileb://{zip_path}',
+                *code_args,
                 '--endpoint-url', localstack_endpoint
             ], check=True)
             
@@ -117,10 +195,8 @@ def deploy_to_localstack(zip_path: str):
             subprocess.run([
                 'aws', 'lambda', 'create-function',
                 '--function-name', function_name,
-                '--runtime', runtime,
                 '--role', 'arn:aws:iam::000000000000:role/lambda-role',
-                '--handler', handler,
-                '--zip-file', f'fileb://{zip_path}',
+                *create_args,
                 '--timeout', str(timeout),
                 '--memory-size', str(memory_size),
                 '--environment', json.dumps(environment),
@@ -220,6 +296,32 @@ def setup_s3_trigger():
     except subprocess.CalledProcessError as e:
         print(f"⚠️  Erro ao configurar trigger: {e}")
 
+def warm_function():
+    """Pré-aquecer a função com uma invocação que não processa PDFs"""
+    print("🔥 Pré-aquecendo a função...")
+    
+    function_name = "bp-ecg-etl-anonymizer"
+    localstack_endpoint = "http://localhost:4566"
+    
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as tmp_file:
+        response_file = tmp_file.name
+    
+    try:
+        # O handler responde a {"warm": true} sem tocar nos buckets
+        subprocess.run([
+            'aws', 'lambda', 'invoke',
+            '--function-name', function_name,
+            '--cli-binary-format', 'raw-in-base64-out',
+            '--payload', json.dumps({"warm": True}),
+            '--endpoint-url', localstack_endpoint,
+            response_file
+        ], check=True, capture_output=True)
+        print("✅ Função pré-aquecida!")
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️  Erro ao pré-aquecer função: {e}")
+    finally:
+        os.unlink(response_file)
+
 def test_deployment():
     """Testar o deployment fazendo upload de um PDF"""
     print("🧪 Testando deployment...")
@@ -279,20 +381,30 @@ def main():
     os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
     
     try:
-        # 1. Criar pacote Lambda
-        zip_path = create_lambda_package()
+        # 1. Criar pacote Lambda: ZIP (padrão) ou imagem de container
+        if os.getenv('LAMBDA_PACKAGE_TYPE', 'Zip') == 'Image':
+            image_uri = build_lambda_image(
+                os.getenv('LAMBDA_IMAGE_URI', 'bp-ecg-etl-anonymizer:latest')
+            )
+            code = {'image_uri': image_uri}
+        else:
+            zip_path = create_lambda_package()
+            code = {'zip_path': zip_path}
         
         # 2. Criar buckets S3
         create_s3_buckets()
         
         # 3. Fazer deploy da função
-        if not deploy_to_localstack(zip_path):
+        if not deploy_to_localstack(**code):
             return False
         
         # 4. Configurar trigger S3
         setup_s3_trigger()
         
-        # 5. Testar deployment
+        # 5. Pré-aquecer a função (o teste não paga o cold start)
+        warm_function()
+        
+        # 6. Testar deployment
         test_deployment()
         
         print("\n🎉 Deploy completo!")
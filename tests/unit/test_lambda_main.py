@@ -0,0 +1,266 @@
+"""Unit tests for the Lambda handler helpers."""
+
+import asyncio
+import os
+import signal
+import socket
+import warnings
+from unittest.mock import AsyncMock, Mock
+
+import fitz
+import orjson
+import pytest
+
+from bp_ecg_etl import lambda_main
+from bp_ecg_etl.lambda_main import (
+    AnonymizerProcess,
+    lambda_handler,
+    parse_s3_event,
+    run_pipeline,
+)
+
+
+def s3_record(bucket, key, source="aws:s3"):
+    """Build a minimal S3 event record."""
+    return {
+        "eventSource": source,
+        "s3": {"bucket": {"name": bucket}, "object": {"key": key}},
+    }
+
+
+class TestParseS3Event:
+    """Test cases for S3 event parsing."""
+
+    def test_yields_pdf_objects_only(self):
+        """Test that only PDF keys from S3 records are yielded."""
+        event = {
+            "Records": [
+                s3_record("raw-pdfs", "exam.pdf"),
+                s3_record("raw-pdfs", "notes.txt"),
+                s3_record("raw-pdfs", "other.PDF"),
+                s3_record("raw-pdfs", "queued.pdf", source="aws:sqs"),
+            ]
+        }
+
+        assert list(parse_s3_event(event)) == [
+            ("raw-pdfs", "exam.pdf"),
+            ("raw-pdfs", "other.PDF"),
+        ]
+
+    def test_unquotes_keys(self):
+        """Test that URL-encoded keys are decoded."""
+        event = {"Records": [s3_record("raw-pdfs", "exames/exemplo+1%C3%A9.pdf")]}
+
+        assert list(parse_s3_event(event)) == [("raw-pdfs", "exames/exemplo 1é.pdf")]
+
+    def test_skips_malformed_records(self):
+        """Test that records that are not dicts are skipped, not raised on."""
+        event = {
+            "Records": [
+                s3_record("raw-pdfs", "exam.pdf"),
+                "garbage",
+                None,
+                s3_record("raw-pdfs", "other.pdf"),
+            ]
+        }
+
+        assert list(parse_s3_event(event)) == [
+            ("raw-pdfs", "exam.pdf"),
+            ("raw-pdfs", "other.pdf"),
+        ]
+
+    @pytest.mark.parametrize("s3_info", [
+        None,
+        "raw-pdfs/exam.pdf",
+        {"bucket": None, "object": {"key": "exam.pdf"}},
+        {"bucket": {"name": "raw-pdfs"}, "object": ["exam.pdf"]},
+        {"bucket": {"name": ["raw-pdfs"]}, "object": {"key": "exam.pdf"}},
+        {"bucket": {"name": "raw-pdfs"}, "object": {"key": 42}},
+    ])
+    def test_skips_records_with_malformed_fields(self, s3_info):
+        """Test that records with a malformed s3/bucket/object/key field are skipped."""
+        event = {
+            "Records": [
+                s3_record("raw-pdfs", "exam.pdf"),
+                {"eventSource": "aws:s3", "s3": s3_info},
+                s3_record("raw-pdfs", "other.pdf"),
+            ]
+        }
+
+        assert list(parse_s3_event(event)) == [
+            ("raw-pdfs", "exam.pdf"),
+            ("raw-pdfs", "other.pdf"),
+        ]
+
+    def test_empty_event(self):
+        """Test handling of an event without records."""
+        assert list(parse_s3_event({})) == []
+
+
+class TestWarmInvocation:
+    """Test cases for pre-warm invocations."""
+
+    def test_warm_event_short_circuits(self, monkeypatch):
+        """Test that a warm ping only initializes the S3 client."""
+        get_s3 = AsyncMock()
+        run_pipeline = AsyncMock()
+        monkeypatch.setattr(lambda_main, "get_s3", get_s3)
+        monkeypatch.setattr(lambda_main, "run_pipeline", run_pipeline)
+        monkeypatch.setattr(lambda_main, "install_sigterm_handler", Mock())
+
+        result = lambda_handler({"warm": True}, None)
+
+        assert result["statusCode"] == 200
+        assert orjson.loads(result["body"]) == {"message": "Warm"}
+        get_s3.assert_awaited_once()
+        run_pipeline.assert_not_called()
+
+    def test_non_dict_event_returns_error(self, monkeypatch):
+        """Test that a non-dict payload gets a 500 response instead of raising."""
+        monkeypatch.setattr(lambda_main, "install_sigterm_handler", Mock())
+
+        result = lambda_handler([{"warm": True}], None)
+
+        assert result["statusCode"] == 500
+        assert orjson.loads(result["body"])["error"] == "Internal server error"
+
+
+class TestRunPipeline:
+    """Test cases for the download -> anonymize -> upload pipeline."""
+
+    async def test_failure_cancels_workers(self, monkeypatch):
+        """Test that no worker task is left pending when feeding the pipeline fails."""
+        monkeypatch.setattr(lambda_main, "download_pdf", AsyncMock(return_value=b"%PDF"))
+
+        def pdf_files():
+            yield "raw-pdfs", "exam.pdf"
+            raise RuntimeError("malformed record")
+
+        with pytest.raises(RuntimeError):
+            await run_pipeline(AsyncMock(), None, pdf_files())
+
+        assert asyncio.all_tasks() == {asyncio.current_task()}
+
+
+@pytest.fixture
+def anonymizer_process():
+    """Start an anonymizer child process and stop it after the test."""
+    process = AnonymizerProcess()
+    yield process
+    process.conn.close()
+    process.process.join(timeout=5)
+
+
+def single_page_pdf():
+    """Build a minimal one-page PDF."""
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Laudo ECG")
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+class TestAnonymizerProcess:
+    """Test cases for the Pipe-fed anonymizer child process."""
+
+    def test_anonymizes_in_child(self, anonymizer_process):
+        """Test that the child returns an anonymized PDF."""
+        output = anonymizer_process.anonymize(single_page_pdf())
+
+        assert output.getvalue().startswith(b"%PDF")
+
+    def test_child_errors_are_raised(self, anonymizer_process):
+        """Test that a failure in the child is raised and the child keeps serving."""
+        with pytest.raises(RuntimeError) as process_error:
+            anonymizer_process.anonymize(b"not a pdf")
+
+        # Reported with the same text as the in-thread fallback
+        with pytest.raises(Exception) as thread_error:
+            lambda_main.anonymize_in_thread(b"not a pdf")
+        assert str(process_error.value) == str(thread_error.value)
+
+        assert anonymizer_process.anonymize(single_page_pdf()).getvalue().startswith(b"%PDF")
+
+    def test_restarts_dead_child(self, anonymizer_process):
+        """Test that a child that exited is restarted on next use."""
+        anonymizer_process.process.kill()
+        anonymizer_process.process.join()
+
+        assert anonymizer_process.anonymize(single_page_pdf()).getvalue().startswith(b"%PDF")
+
+    @pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="needs /proc")
+    async def test_restart_from_thread_is_isolated(self, anonymizer_process):
+        """Test that a restart from a worker thread neither forks this process nor leaks sockets."""
+        anonymizer_process.process.kill()
+        anonymizer_process.process.join()
+
+        parent_socket, other_socket = socket.socketpair()
+        try:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", DeprecationWarning)
+                await asyncio.to_thread(anonymizer_process.anonymize, single_page_pdf())
+
+            assert not [w for w in caught if "fork" in str(w.message)]
+
+            socket_link = os.readlink(f"/proc/self/fd/{parent_socket.fileno()}")
+            child_fds = f"/proc/{anonymizer_process.process.pid}/fd"
+            child_links = {os.readlink(os.path.join(child_fds, fd)) for fd in os.listdir(child_fds)}
+            assert socket_link not in child_links
+        finally:
+            parent_socket.close()
+            other_socket.close()
+
+
+class TestAnonymizeInThread:
+    """Test cases for the in-thread anonymization fallback."""
+
+    def test_holds_module_lock(self, monkeypatch):
+        """Test that the fallback runs PyMuPDF under the module-level lock."""
+        lock_held = []
+        monkeypatch.setattr(
+            lambda_main,
+            "anonymize_pdf",
+            lambda content: lock_held.append(lambda_main._THREAD_ANONYMIZE_LOCK.locked()),
+        )
+
+        lambda_main.anonymize_in_thread(b"%PDF-1.7")
+
+        assert lock_held == [True]
+        assert not lambda_main._THREAD_ANONYMIZE_LOCK.locked()
+
+
+class TestSigtermHandler:
+    """Test cases for the SIGTERM handler."""
+
+    @pytest.fixture(autouse=True)
+    def restore_sigterm(self, monkeypatch):
+        """Restore the process SIGTERM handler and the module state after each test."""
+        original = signal.getsignal(signal.SIGTERM)
+        monkeypatch.setattr(lambda_main, "_SIGTERM_INSTALLED", False)
+        monkeypatch.setattr(lambda_main, "_PREVIOUS_SIGTERM", None)
+        monkeypatch.setattr(lambda_main, "_LOOP", None)
+        yield
+        signal.signal(signal.SIGTERM, original)
+
+    def test_import_does_not_install_handler(self):
+        """Test that importing the module leaves SIGTERM alone."""
+        assert signal.getsignal(signal.SIGTERM) is not lambda_main._handle_sigterm
+
+    def test_chains_to_previous_handler(self):
+        """Test that the previously installed handler still runs."""
+        previous = Mock()
+        signal.signal(signal.SIGTERM, previous)
+
+        lambda_main.install_sigterm_handler()
+        assert signal.getsignal(signal.SIGTERM) is lambda_main._handle_sigterm
+
+        lambda_main._handle_sigterm(signal.SIGTERM, None)
+        previous.assert_called_once_with(signal.SIGTERM, None)
+
+    def test_exits_when_previous_is_default(self):
+        """Test that the default action still ends the process."""
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        lambda_main.install_sigterm_handler()
+
+        with pytest.raises(SystemExit):
+            lambda_main._handle_sigterm(signal.SIGTERM, None)
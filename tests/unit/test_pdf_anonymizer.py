@@ -0,0 +1,205 @@
+"""Unit tests for PDF anonymization."""
+
+import fitz
+import pytest
+
+from bp_ecg_etl.config import LABEL_KINDS, PAGE2_REDACT_COORDS
+from bp_ecg_etl.pdf_anonymizer import (
+    anonymize_pdf,
+    redact_crm_and_upper_name,
+    redact_line_values_after_label,
+    resolve_redact_rects,
+)
+
+PATIENT_NAME = "JOAO DA SILVA"
+
+
+def two_page_pdf_with_document_extras() -> bytes:
+    """Build a 2-page PDF carrying the patient name outside the page content."""
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), "Laudo ECG")
+    page2 = doc.new_page()
+    page2.insert_text((72, 72), "Traçado")
+
+    # Bookmark naming the patient
+    doc.set_toc([[1, f"Paciente {PATIENT_NAME}", 1]])
+
+    # Form field on page 2 holding the patient name
+    widget = fitz.Widget()
+    widget.field_name = "paciente"
+    widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+    widget.field_value = PATIENT_NAME
+    widget.rect = fitz.Rect(72, 100, 300, 120)
+    page2.add_widget(widget)
+
+    content = doc.tobytes()
+    doc.close()
+    return content
+
+
+def page_with_lines(*lines):
+    """Open a one-page document with each (y, text) line written at that baseline."""
+    doc = fitz.open()
+    page = doc.new_page()
+    for y, text in lines:
+        page.insert_text((72, y), text, fontsize=10)
+    return doc, page
+
+
+def page_words(page):
+    """Words left on ``page`` after its redactions are applied."""
+    page.apply_redactions()
+    return [w[4] for w in page.get_text("words")]
+
+
+class TestRedactLineValuesAfterLabel:
+    """Test cases for label-based value redaction."""
+
+    def test_values_redacted_up_to_next_label(self):
+        """Test that a label's value is removed up to the next label on the line."""
+        doc, page = page_with_lines((100, "Nome: JOAO DA SILVA Sexo: Masculino"))
+
+        redact_line_values_after_label(page)
+
+        assert page_words(page) == ["Nome:", "Sexo:", "Masculino"]
+        doc.close()
+
+    def test_keep_label_values_preserved(self):
+        """Test that values after KEEP labels are not redacted."""
+        doc, page = page_with_lines((100, "Data: 01/02/2024 Hora: 10:30"))
+
+        redact_line_values_after_label(page)
+
+        assert page_words(page) == ["Data:", "01/02/2024", "Hora:", "10:30"]
+        doc.close()
+
+    def test_labels_match_without_colon(self):
+        """Test that label tokens are recognized with or without their colon."""
+        doc, page = page_with_lines((100, "Nome JOAO DA SILVA Sexo Masculino"))
+
+        redact_line_values_after_label(page)
+
+        assert page_words(page) == ["Nome", "Sexo", "Masculino"]
+        doc.close()
+
+    def test_label_lookup_matches_colon_normalization(self):
+        """Test that the lookup accepts exactly the label with or without one colon."""
+        assert LABEL_KINDS["Nome:"] == LABEL_KINDS["Nome"] == "redact"
+        assert LABEL_KINDS["Sexo:"] == LABEL_KINDS["Sexo"] == "keep"
+        assert "Nome::" not in LABEL_KINDS
+
+    def test_lines_are_independent(self):
+        """Test that a label only redacts values on its own line."""
+        doc, page = page_with_lines(
+            (100, "CPF: 12345678900"),
+            (130, "Sexo: Masculino"),
+        )
+
+        redact_line_values_after_label(page)
+
+        assert page_words(page) == ["CPF:", "Sexo:", "Masculino"]
+        doc.close()
+
+
+class TestRedactCrmAndUpperName:
+    """Test cases for CRM and signature redaction."""
+
+    def test_crm_and_signature_line_redacted(self):
+        """Test that the CRM and the text to its right, plus the signature above, are removed."""
+        doc, page = page_with_lines(
+            (100, "Laudo normal"),
+            (700, "Dr Fulano Beltrano"),
+            (718, "Assinado CRM 123456 SP"),
+        )
+
+        redact_crm_and_upper_name(page)
+
+        assert page_words(page) == ["Laudo", "normal", "Assinado"]
+        doc.close()
+
+    def test_label_line_above_crm_kept(self):
+        """Test that a labelled line above the CRM is not taken for a signature."""
+        doc, page = page_with_lines(
+            (700, "Sexo: Masculino"),
+            (718, "CRM 123456"),
+        )
+
+        redact_crm_and_upper_name(page)
+
+        assert page_words(page) == ["Sexo:", "Masculino"]
+        doc.close()
+
+
+class TestResolveRedactRects:
+    """Test cases for relative-to-absolute rectangle resolution."""
+
+    def test_coordinates_clamped_and_ordered(self):
+        """Test that coordinates are clamped to the bounds and swapped corners reordered."""
+        rects = resolve_redact_rects(10, 20, 200, 100, ((0.5, 0.5, 0.1, 0.2), (2, -1, 3, 0.5)))
+
+        assert rects == (fitz.Rect(30, 40, 110, 70), fitz.Rect(210, 20, 210, 70))
+
+
+class TestClearPdfMetadata:
+    """Test cases for metadata removal."""
+
+    @pytest.mark.parametrize("pages", [1, 2])
+    def test_info_dict_is_empty(self, pages):
+        """Test that the output carries no Info dictionary entries."""
+        doc = fitz.open()
+        for _ in range(pages):
+            doc.new_page()
+        doc.set_metadata({"author": PATIENT_NAME, "title": f"ECG {PATIENT_NAME}"})
+        source = doc.tobytes()
+        doc.close()
+
+        output = fitz.open(stream=anonymize_pdf(source).getvalue(), filetype="pdf")
+        try:
+            # No /Info entry left in the trailer at all
+            assert output.xref_get_key(-1, "Info") == ("null", "null")
+            assert PATIENT_NAME.encode() not in output.tobytes(expand=255)
+        finally:
+            output.close()
+
+
+class TestAnonymizeMultiPagePdf:
+    """Test cases for multi-page PDF anonymization."""
+
+    def test_document_level_data_is_dropped(self):
+        """Test that outlines and page-2 form fields do not reach the output."""
+        output = anonymize_pdf(two_page_pdf_with_document_extras())
+
+        doc = fitz.open(stream=output.getvalue(), filetype="pdf")
+        try:
+            assert len(doc) == 2
+            assert doc.get_toc() == []
+            assert not any(page.first_widget for page in doc)
+            # Decompress every stream so the search also covers compressed objects
+            assert PATIENT_NAME.encode() not in doc.tobytes(expand=255)
+        finally:
+            doc.close()
+
+    def test_page2_boxes_filled(self):
+        """Test that every page-2 redaction box is black in the rasterized page."""
+        doc = fitz.open()
+        doc.new_page()
+        page2 = doc.new_page()
+        page2.draw_rect(page2.rect, color=(0.5, 0.5, 0.5), fill=(0.5, 0.5, 0.5))
+        source = doc.tobytes()
+        doc.close()
+
+        output = fitz.open(stream=anonymize_pdf(source).getvalue(), filetype="pdf")
+        pix = output[1].get_pixmap(alpha=False)
+        output.close()
+
+        boxes = [
+            rect for rect in resolve_redact_rects(0, 0, pix.width, pix.height, PAGE2_REDACT_COORDS)
+            if not rect.irect.is_empty
+        ]
+        assert boxes
+        for rect in boxes:
+            center = (int((rect.x0 + rect.x1) / 2), int((rect.y0 + rect.y1) / 2))
+            assert max(pix.pixel(*center)) < 40
+
+        # Outside the boxes the page content is kept
+        assert min(pix.pixel(pix.width // 2, pix.height // 2)) > 80
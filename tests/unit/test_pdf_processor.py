@@ -1,21 +0,0 @@
-"""Unit tests for PDF processor."""
-
-import pytest
-from unittest.mock import Mock, AsyncMock
-from bp_ecg_etl.core.pdf_processor import extract_text_from_pdf
-
-
-class TestPdfProcessor:
-    """Test cases for PDF processing functionality."""
-
-    @pytest.mark.asyncio
-    async def test_extract_text_from_pdf_success(self):
-        """Test successful text extraction from PDF."""
-        # This is a placeholder test - implement actual tests as needed
-        pass
-
-    @pytest.mark.asyncio
-    async def test_extract_text_from_pdf_empty(self):
-        """Test handling of empty PDF."""
-        # This is a placeholder test - implement actual tests as needed
-        pass
@@ -0,0 +1,228 @@
+"""Unit tests for the S3 helpers."""
+
+import asyncio
+import io
+
+import pytest
+from botocore.exceptions import ClientError
+
+from bp_ecg_etl import s3_utils
+from bp_ecg_etl.s3_utils import download_ranges, generate_output_key, multipart_upload
+
+
+class FakeBody:
+    """Minimal stand-in for an aiobotocore streaming body."""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def read(self):
+        return self.data
+
+
+class FakeS3:
+    """In-memory S3 client serving get_object, with optional Range support."""
+
+    def __init__(self, data, honour_range=True):
+        self.data = data
+        self.honour_range = honour_range
+        self.calls = []
+
+    async def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        self.calls.append(Range)
+        if Range is None or not self.honour_range:
+            return {"Body": FakeBody(self.data), "ETag": '"etag"'}
+        if not self.data:
+            raise ClientError({"Error": {"Code": "InvalidRange"}}, "GetObject")
+
+        start, end = map(int, Range.removeprefix("bytes=").split("-"))
+        end = min(end, len(self.data) - 1)
+        return {
+            "Body": FakeBody(self.data[start:end + 1]),
+            "ContentRange": f"bytes {start}-{end}/{len(self.data)}",
+            "ETag": '"etag"',
+        }
+
+
+class FakeMultipartS3:
+    """In-memory S3 client recording multipart upload calls."""
+
+    def __init__(self, fail_part=None, slow_part=None, abort_error=None):
+        self.fail_part = fail_part
+        self.slow_part = slow_part
+        self.abort_error = abort_error
+        self.parts = {}
+        self.in_flight = set()
+        self.in_flight_at_abort = None
+        self.completed = None
+        self.aborted = False
+
+    async def create_multipart_upload(self, **params):
+        return {"UploadId": "upload-1"}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.in_flight.add(PartNumber)
+        try:
+            if PartNumber == self.slow_part:
+                await asyncio.sleep(60)
+            if PartNumber == self.fail_part:
+                raise ClientError({"Error": {"Code": "InternalError"}}, "UploadPart")
+            self.parts[PartNumber] = Body
+        finally:
+            self.in_flight.discard(PartNumber)
+        return {"ETag": f'"part-{PartNumber}"'}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.in_flight_at_abort = set(self.in_flight)
+        self.aborted = True
+        if self.abort_error is not None:
+            raise self.abort_error
+
+
+class TestGenerateOutputKey:
+    """Test cases for output key generation."""
+
+    def test_preserves_directory_and_extension(self):
+        """Test that the directory and extension of the input key are kept."""
+        key = generate_output_key("exames/2024/exam.PDF")
+
+        assert key.startswith("exames/2024/anonymized_")
+        assert key.endswith(".PDF")
+
+    def test_key_without_directory(self):
+        """Test keys at the bucket root."""
+        key = generate_output_key("exam.pdf", prefix="anon")
+
+        assert key.startswith("anon_")
+        assert "/" not in key
+
+    def test_defaults_to_pdf_extension(self):
+        """Test that dots in the directory are not taken as the extension."""
+        key = generate_output_key("lote.v2/exam")
+
+        assert key.startswith("lote.v2/anonymized_")
+        assert key.endswith(".pdf")
+
+    def test_keys_are_unique(self):
+        """Test that repeated calls generate distinct keys."""
+        assert generate_output_key("exam.pdf") != generate_output_key("exam.pdf")
+
+
+class TestDownloadRanges:
+    """Test cases for ranged S3 downloads."""
+
+    async def test_small_object_single_request(self, monkeypatch):
+        """Test that objects within one chunk take a single GET."""
+        monkeypatch.setattr(s3_utils, "S3_RANGE_CHUNK_SIZE", 8)
+        s3 = FakeS3(b"%PDF-1.7")
+
+        assert await download_ranges(s3, "raw-pdfs", "exam.pdf") == b"%PDF-1.7"
+        assert s3.calls == ["bytes=0-7"]
+
+    async def test_large_object_joined_in_order(self, monkeypatch):
+        """Test that larger objects are fetched as ranges and reassembled."""
+        monkeypatch.setattr(s3_utils, "S3_RANGE_CHUNK_SIZE", 4)
+        data = b"%PDF-1.7 ranged body"
+        s3 = FakeS3(data)
+
+        content = await download_ranges(s3, "raw-pdfs", "exam.pdf")
+
+        # Ranges are written into one preallocated buffer, not joined afterwards
+        assert isinstance(content, bytearray)
+        assert content == data
+        assert s3.calls == [
+            "bytes=0-3", "bytes=4-7", "bytes=8-11", "bytes=12-15", "bytes=16-19"
+        ]
+
+    async def test_missing_content_range_returns_full_body(self, monkeypatch):
+        """Test that a response served without Content-Range is taken as the whole object."""
+        monkeypatch.setattr(s3_utils, "S3_RANGE_CHUNK_SIZE", 4)
+        data = b"%PDF-1.7 ranged body"
+        s3 = FakeS3(data, honour_range=False)
+
+        assert await download_ranges(s3, "raw-pdfs", "exam.pdf") == data
+        assert s3.calls == ["bytes=0-3"]
+
+    async def test_missing_content_range_full_chunk_rereads(self, monkeypatch):
+        """Test that a full chunk without Content-Range falls back to a plain GET."""
+        monkeypatch.setattr(s3_utils, "S3_RANGE_CHUNK_SIZE", 8)
+        s3 = FakeS3(b"%PDF-1.7", honour_range=False)
+
+        assert await download_ranges(s3, "raw-pdfs", "exam.pdf") == b"%PDF-1.7"
+        assert s3.calls == ["bytes=0-7", None]
+
+    async def test_empty_object(self):
+        """Test that empty objects fall back to a plain GET."""
+        s3 = FakeS3(b"")
+
+        assert await download_ranges(s3, "raw-pdfs", "empty.pdf") == b""
+        assert s3.calls[-1] is None
+
+
+class TestMultipartUpload:
+    """Test cases for multipart S3 uploads."""
+
+    async def test_parts_cover_content_in_order(self, monkeypatch):
+        """Test that parts are sliced from the buffer and completed in order."""
+        monkeypatch.setattr(s3_utils, "S3_MULTIPART_PART_SIZE", 4)
+        s3 = FakeMultipartS3()
+
+        await multipart_upload(s3, "anon-pdfs", "exam.pdf", io.BytesIO(b"%PDF-1.7 body"))
+
+        assert s3.parts == {1: b"%PDF", 2: b"-1.7", 3: b" bod", 4: b"y"}
+        assert [part["PartNumber"] for part in s3.completed] == [1, 2, 3, 4]
+        assert not s3.aborted
+
+    async def test_failed_part_aborts_upload(self, monkeypatch):
+        """Test that a failing part aborts the multipart upload."""
+        monkeypatch.setattr(s3_utils, "S3_MULTIPART_PART_SIZE", 4)
+        s3 = FakeMultipartS3(fail_part=2)
+
+        with pytest.raises(ClientError):
+            await multipart_upload(s3, "anon-pdfs", "exam.pdf", b"%PDF-1.7 body")
+
+        assert s3.aborted
+        assert s3.completed is None
+
+    async def test_failed_part_stops_parts_in_flight(self, monkeypatch):
+        """Test that parts still uploading are cancelled before the abort."""
+        monkeypatch.setattr(s3_utils, "S3_MULTIPART_PART_SIZE", 4)
+        s3 = FakeMultipartS3(fail_part=2, slow_part=1)
+
+        with pytest.raises(ClientError):
+            await multipart_upload(s3, "anon-pdfs", "exam.pdf", b"%PDF-1.7 body")
+
+        assert s3.aborted
+        assert s3.in_flight_at_abort == set()
+        assert 1 not in s3.parts
+
+    async def test_cancelled_upload_is_aborted(self, monkeypatch):
+        """Test that cancelling the upload still aborts it."""
+        monkeypatch.setattr(s3_utils, "S3_MULTIPART_PART_SIZE", 4)
+        s3 = FakeMultipartS3(slow_part=1)
+
+        task = asyncio.create_task(
+            multipart_upload(s3, "anon-pdfs", "exam.pdf", b"%PDF-1.7 body")
+        )
+        while 1 not in s3.in_flight:
+            await asyncio.sleep(0)
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert s3.aborted
+        assert s3.in_flight_at_abort == set()
+
+    async def test_abort_failure_keeps_original_error(self, monkeypatch):
+        """Test that a failing abort does not mask the upload error."""
+        monkeypatch.setattr(s3_utils, "S3_MULTIPART_PART_SIZE", 4)
+        abort_error = ClientError({"Error": {"Code": "NoSuchUpload"}}, "AbortMultipartUpload")
+        s3 = FakeMultipartS3(fail_part=2, abort_error=abort_error)
+
+        with pytest.raises(ClientError) as excinfo:
+            await multipart_upload(s3, "anon-pdfs", "exam.pdf", b"%PDF-1.7 body")
+
+        assert excinfo.value.operation_name == "UploadPart"